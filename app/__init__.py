@@ -1,3 +1,7 @@
+import os
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask import Flask
@@ -14,15 +18,32 @@ class FlaskAdapted(Flask):
         super().__init__(import_name, **kwargs)
         self.captcha_count = captcha_count
 
-        self.captcha_cdn: TTLCache[str, dict] = TTLCache(ttl=60)
-        self.captchas_solution: TTLCache[str, dict] = TTLCache(ttl=90)
+        # itertools.count is atomic under the GIL, so concurrent requests can't
+        # lose increments the way captcha_count += 1 could
+        self._captcha_counter = itertools.count(captcha_count + 1)
+
+        self.captcha_cdn: TTLCache[str, dict] = TTLCache(ttl=60, maxsize=10_000)
+        self.captchas_solution: TTLCache[str, dict] = TTLCache(ttl=90, maxsize=10_000)
+
+        # Captchas are rendered on this pool as soon as they are issued, so a
+        # CDN hit usually only has to stream bytes that are already encoded
+        self.render_pool = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="captcha-render"
+        )
 
         CORS(self)
 
 
 flask_app = FlaskAdapted(__name__)
 
-limiter = Limiter(key_func=get_remote_address, storage_uri="memory://")
+# Point this at e.g. redis://localhost:6379 in production so limits are shared
+# across workers; the in-memory default keeps development and tests standalone.
+# moving-window closes the 2x burst fixed windows allow at boundary crossings
+limiter = Limiter(
+    key_func=get_remote_address,
+    storage_uri=os.environ.get("RATELIMIT_STORAGE_URI", "memory://"),
+    strategy="moving-window",
+)
 limiter.init_app(flask_app)
 
 
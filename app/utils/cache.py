@@ -29,8 +29,9 @@ class TTLCache(MutableMapping[KT, VT], Generic[KT, VT]):
 
     """
 
-    def __init__(self, ttl: int = 30):
+    def __init__(self, ttl: int = 30, maxsize: Optional[int] = None):
         self.ttl = ttl
+        self.maxsize = maxsize
         self.cache: dict[KT, tuple[VT, datetime.datetime]] = {}
 
     def __getitem__(self, item: KT) -> VT:
@@ -57,6 +58,15 @@ class TTLCache(MutableMapping[KT, VT], Generic[KT, VT]):
     def __setitem__(self, key: KT, value: VT) -> None:
         self.__check_expiry()
 
+        # Evict the oldest record (first inserted, see __check_expiry) so the
+        # cache cannot grow without bound even if nothing has expired yet
+        if (
+            self.maxsize is not None
+            and key not in self.cache
+            and len(self.cache) >= self.maxsize
+        ):
+            self.cache.pop(next(iter(self.cache)))
+
         self.cache[key] = (value, _time(self.ttl))
 
     def __len__(self) -> int:
@@ -82,7 +92,18 @@ class TTLCache(MutableMapping[KT, VT], Generic[KT, VT]):
     def get(self, item: KT, /, default: Optional[T] = None) -> Union[VT, T, None]:
         self.__check_expiry()
 
-        return self.cache.get(item, (default,))[0]
+        # The sweep above stops at the first live record, so this one still
+        # needs its own expiry check (same as __contains__)
+        try:
+            value, dt = self.cache[item]
+        except KeyError:
+            return default
+
+        if _check_if_expired(dt):
+            del self.cache[item]
+            return default
+
+        return value
 
     def __check_expiry(self) -> None:
         """This function removes expired records from the cache dictionary.
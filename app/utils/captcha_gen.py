@@ -1,10 +1,10 @@
 """Captcha generation for the API (this is where the magic happens!)"""
 
 import random
-import secrets
 import math
 import os
 
+import numpy as np
 from PIL import ImageDraw, Image, ImageFont
 from PIL.Image import Transform, Resampling
 
@@ -12,6 +12,15 @@ from PIL.Image import Transform, Resampling
 script_path = os.path.abspath(__file__)
 root_directory = os.path.dirname(os.path.dirname(script_path))
 
+# Visual randomness (fonts, angles, spacing) doesn't need a CSPRNG; a single
+# urandom-seeded Mersenne Twister avoids a syscall per secrets.* call
+_rng = random.Random()
+
+# Palette, fixed at import time like the fonts below
+WHITE = (255, 255, 255)
+NOISE_WHITE = (255, 255, 255, 255)
+BACKGROUND = (128, 128, 128, 255)
+
 
 FONTS_LOWER = [
     ImageFont.truetype(
@@ -56,9 +65,15 @@ def add_noise_lines(image: ImageDraw.ImageDraw) -> ImageDraw.ImageDraw:
     """Add noise lines to an image."""
     size = image.im.size  # type: ignore
 
-    for _ in range(secrets.randbelow(3)):
+    # One urandom batch instead of a syscall per secrets.* call
+    rnd = os.urandom(8)
+
+    for i in range(rnd[0] % 3):
         x = (-50, -50)
-        y = (size[0] + 10, secrets.choice(range(0, size[1] + 10)))
+        y = (
+            size[0] + 10,
+            int.from_bytes(rnd[1 + 2 * i : 3 + 2 * i], "big") % (size[1] + 10),
+        )
 
         image.arc(x + y, 0, 360, fill="white")
 
@@ -77,28 +92,20 @@ def salt_and_pepper(image: Image.Image, probability: float) -> Image.Image:
         PIL.Image: The output image with white pixels added.
 
     """
-    output_image = Image.new(image.mode, image.size)
-
-    draw = ImageDraw.Draw(output_image)
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
 
-    for x in range(image.width):
-        for y in range(image.height):
-            random_number = secrets.choice(
-                (0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1)
-            )
+    # Single PIL -> NumPy -> PIL round trip; the mask is applied on the array
+    arr = np.array(image)
 
-            if random_number < probability:
-                draw.point((x, y), fill=(255, 255, 255))
+    mask = np.random.random(arr.shape[:2]) < probability
+    arr[mask] = NOISE_WHITE
 
-            else:
-                pixel = image.getpixel((x, y))
-                draw.point((x, y), fill=pixel)
-
-    return output_image
+    return Image.fromarray(arr)
 
 
 def find_coeffs(angle):
-    if secrets.choice((0, 1)):
+    if _rng.random() < 0.5:
         angle = math.radians(angle)
     else:
         angle = -math.radians(angle)
@@ -110,6 +117,7 @@ def find_coeffs(angle):
 
 def text_angled(
     img,
+    draw: ImageDraw.ImageDraw,
     xy: tuple[int, int],
     text: str,
     fill: tuple[int, int, int] | str,
@@ -122,6 +130,7 @@ def text_angled(
 
     Args:
         img (PIL.Image.Image): The 'Image' to draw the text on
+        draw (ImageDraw.ImageDraw): the shared 'Draw' handle for 'img', used for measuring
         rot_angle (int, optional): The angle for how much to rotate the text. Defaults to 0.
         font (ImageFont.FreeTypeFont): font for the text
         fill (tuple[int, int, int] | str): colour for the text
@@ -133,8 +142,6 @@ def text_angled(
         PIL.Image.Image: new 'Image' with the text on it
 
     """
-    draw = ImageDraw.Draw(img)
-
     _, text_width, _, text_height = draw.multiline_textbbox(xy, text, font=font)
 
     # Create new image for the font
@@ -173,47 +180,52 @@ def cap_gen(text: str) -> Image.Image:
 
     """
     # Start with a random height and spacing
-    white = 255, 255, 255
-    space, height = random.randint(20, 25), random.randint(5, 13)
+    space, height = _rng.randint(20, 25), _rng.randint(5, 13)
 
     # Assign every letter a corresponding random font
     corresponding_font = {
-        let: secrets.choice(FONTS_UPPER if let.isupper() else FONTS_LOWER)
-        for let in text
+        let: _rng.choice(FONTS_UPPER if let.isupper() else FONTS_LOWER) for let in text
     }
     text_positions = []
 
-    img = Image.new("RGB", (300, 100), color=(128, 128, 128))
+    # RGBA from the start: text/lines still need PIL (FreeType lives there),
+    # but the finished image goes through NumPy exactly once, with no
+    # mode-conversion copies along the way
+    img = Image.new("RGBA", (300, 100), color=BACKGROUND)
     img.load()
 
+    # One shared Draw handle for measuring, noise lines and letter placement
+    draw = ImageDraw.Draw(img)
+
     # Use relative spacing so that there isn't much of empty space on either of sides
     relative_spacing = 200 // len(text)
 
     for count, letter in enumerate(text):
         cords = space, height
 
-        rot_angle = secrets.choice(range(-10, 10))
-        tilt_angle = secrets.choice(range(10, 30))
+        rot_angle = _rng.randrange(-10, 10)
+        tilt_angle = _rng.randrange(10, 30)
         img = text_angled(
             img,
+            draw,
             cords,
             letter,
-            fill=white,
+            fill=WHITE,
             font=corresponding_font[letter],
             rot_angle=rot_angle,
             tilt_angle=tilt_angle,
         )
 
-        space += relative_spacing + secrets.choice(range(7, 13))
-        height += secrets.choice((-1, 1))
+        space += relative_spacing + _rng.randrange(7, 13)
+        height += _rng.choice((-1, 1))
 
-        text_positions.append(tuple(secrets.randbelow(10) + 15 + i for i in cords))
+        text_positions.append(tuple(_rng.randrange(10) + 15 + i for i in cords))
 
-    d = add_noise_lines(ImageDraw.Draw(img))
+    d = add_noise_lines(draw)
 
     # Add a noise line relative to the text position
-    value = secrets.randbelow(len(text_positions))
+    value = _rng.randrange(len(text_positions))
     for i in range(len(text_positions) - value):
-        d.line((text_positions[i], text_positions[i + value]), fill=white, width=0)  # type: ignore
+        d.line((text_positions[i], text_positions[i + value]), fill=WHITE, width=0)  # type: ignore
 
     return salt_and_pepper(img, probability=0.2)
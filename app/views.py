@@ -1,12 +1,13 @@
 """Routes for the API"""
 
 import secrets
-import datetime
 import base64
+import time
+import hmac
+import hashlib
 from io import BytesIO
-from urllib.parse import urljoin
 
-from flask import send_file, render_template, jsonify, redirect, request
+from flask import Response, render_template, jsonify, redirect, request
 
 from .utils import cap_gen
 from app import limiter, flask_app
@@ -20,31 +21,62 @@ def _id_generator(y: int) -> str:
         y (int): The length of the captcha ID string to be generated.
 
     Returns:
-        str: The captcha ID string of length 'y' generated by calling the 'choice' function on the given sequence of
-            characters.
+        str: The captcha ID string of length 'y', built by mapping batches of random bytes onto the character set.
 
     """
     string = "abcdefghijkmnopqrstuvwxyzABCDEFGHJKMNOPQRSTUVWXYZ"
-    return "".join(secrets.choice(string) for _ in range(y))
 
+    # Rejection sampling: bytes >= limit would wrap unevenly onto the 49
+    # characters, biasing the first 256 % 49 of them, so they are skipped
+    limit = 256 - 256 % len(string)
+    chars: list[str] = []
 
-def _b64_encrypt_id():
+    while len(chars) < y:
+        chars += [
+            string[byte % len(string)]
+            for byte in secrets.token_bytes(2 * (y - len(chars)))
+            if byte < limit
+        ]
+
+    return "".join(chars[:y])
+
+
+def _b64_encrypt_id(count: int) -> str:
     """
     Encrypt given ID into base64.
 
     Decrypting this returns the captcha amount to date and the milisecond it was created
     """
-    now = datetime.datetime.utcnow()
-    time_now = now.strftime("%S")[-5:]
+    time_now = time.time_ns() // 1_000_000
 
     return base64.b64encode(
         bytes(
-            f"{flask_app.captcha_count}.{_id_generator(y=10)}.{time_now}",
+            f"{count}.{_id_generator(y=10)}.{time_now}",
             "utf-8",
         )
     ).decode()
 
 
+def _render_png(solution: str) -> tuple[bytes, str]:
+    """
+    Render a captcha and encode it to PNG, returning the bytes and their ETag.
+
+    Runs on the app's render pool so the request thread never pays for
+    rendering or encoding.
+    """
+    pil_image = cap_gen(text=solution)
+
+    # cap_gen already yields RGBA; only convert (full-image copy) if not
+    if pil_image.mode != "RGBA":
+        pil_image = pil_image.convert("RGBA")
+
+    output = BytesIO()
+    pil_image.save(output, format="PNG", compress_level=1, optimize=False)
+    png_bytes = output.getvalue()
+
+    return png_bytes, hashlib.md5(png_bytes).hexdigest()
+
+
 @flask_app.route("/api/v5/cdn/<key>", methods=["GET"])
 @limiter.limit("30/minute")
 def get_img(key: str):
@@ -59,12 +91,22 @@ def get_img(key: str):
 
     """
     try:
-        if (
-            flask_app.captcha_cdn[key]["cdn_accessed_number"]
-            >= flask_app.captcha_cdn[key]["max_cdn_access"]
-        ):
-            del flask_app.captchas_solution[flask_app.captcha_cdn[key]["solution_id"]]
-            del flask_app.captcha_cdn[key]
+        # Hoist the record to a local; every TTLCache access runs an expiry sweep
+        cdn_entry = flask_app.captcha_cdn[key]
+
+        # Revalidation is free: a matching If-None-Match gets a 304 without
+        # burning the access quota (the TTL still expires the record)
+        if cdn_entry["etag"] is not None and cdn_entry["etag"] in request.if_none_match:
+            response = Response(status=304)
+            response.set_etag(cdn_entry["etag"])
+
+            return response
+
+        if cdn_entry["cdn_accessed_number"] >= cdn_entry["max_cdn_access"]:
+            # pop instead of del: eviction or TTL may already have removed
+            # either record, and that must not read as "cdn key not found"
+            flask_app.captchas_solution.pop(cdn_entry["solution_id"], None)
+            flask_app.captcha_cdn.pop(key, None)
 
             return (
                 jsonify(
@@ -77,19 +119,21 @@ def get_img(key: str):
                 418,
             )
 
-        flask_app.captcha_cdn[key]["cdn_accessed_number"] += 1
+        cdn_entry["cdn_accessed_number"] += 1
+
+        if not cdn_entry["png_bytes"]:
+            # The render was kicked off when the captcha was issued; block on
+            # the future only if the client beat the pool to it
+            cdn_entry["png_bytes"], cdn_entry["etag"] = cdn_entry["render"].result()
 
-        if not flask_app.captcha_cdn[key]["image"]:
-            pil_image = cap_gen(text=flask_app.captcha_cdn[key]["solution"])
-            flask_app.captcha_cdn[key]["image"] = pil_image
-        else:
-            pil_image = flask_app.captcha_cdn[key]["image"]
+        png_bytes = cdn_entry["png_bytes"]
 
-        output = BytesIO()
-        pil_image.convert("RGBA").save(output, format="PNG")
-        output.seek(0, 0)
+        # A direct Response avoids the BytesIO wrapper and send_file's wrapped
+        # file streaming for what is a tiny in-memory payload
+        response = Response(png_bytes, mimetype="image/png")
+        response.set_etag(cdn_entry["etag"])
 
-        return send_file(output, mimetype="image/png", as_attachment=False)
+        return response.make_conditional(request)
 
     except KeyError:
         return jsonify({"code": 400, "type": "error", "text": "cdn key not found"}), 400
@@ -141,33 +185,35 @@ def api_captcha():
             400,
         )
 
-    solution_id = _b64_encrypt_id()
+    # Draw the count first so concurrent requests embed distinct values;
+    # the captcha_count mirror is kept for external observability only
+    flask_app.captcha_count = count = next(flask_app._captcha_counter)
+
+    solution_id = _b64_encrypt_id(count)
     solution = _id_generator(y=secrets.choice((4, 5)))
     flask_app.captchas_solution[solution_id] = {
         "solution": solution,
+        "solution_lower": solution.lower(),
         "max_solution_check": solution_check,
         "solution_checked": 0,
     }
 
-    delta = datetime.timedelta(minutes=5)
-    now = datetime.datetime.utcnow()
-    cdn_id = _b64_encrypt_id()
+    cdn_id = _b64_encrypt_id(count)
     flask_app.captcha_cdn[cdn_id] = {
         "solution": solution,
-        "image": None,
-        "time": now + delta,
+        "png_bytes": None,
+        "etag": None,
+        "render": flask_app.render_pool.submit(_render_png, solution),
         "cdn_accessed_number": 0,
         "max_cdn_access": cdn_access,
         "solution_id": solution_id,
     }
-    flask_app.captcha_count += 1
 
     return jsonify(
         {
-            "cdn_url": urljoin(request.host_url, f"/api/v5/cdn/{cdn_id}"),
-            "solution_check_url": urljoin(
-                request.host_url, f"/api/v5/check/{solution_id}"
-            ),
+            # request.host_url always ends with a slash
+            "cdn_url": f"{request.host_url}api/v5/cdn/{cdn_id}",
+            "solution_check_url": f"{request.host_url}api/v5/check/{solution_id}",
             "solution_id": solution_id,
             "cdn_id": cdn_id,
         }
@@ -177,13 +223,13 @@ def api_captcha():
 @flask_app.route("/api/v5/check/<solution_id>", methods=["POST"])
 @limiter.limit("10/minute")
 def check_solution(solution_id: str):
-    if solution_id not in flask_app.captchas_solution:
+    # Hoist the record to a local; every TTLCache access runs an expiry sweep
+    captcha_data = flask_app.captchas_solution.get(solution_id)
+
+    if captcha_data is None:
         return {"type": "error", "code": 400, "text": "solution_id not found"}, 400
 
-    if (
-        flask_app.captchas_solution[solution_id]["solution_checked"]
-        >= flask_app.captchas_solution[solution_id]["max_solution_check"]
-    ):
+    if captcha_data["solution_checked"] >= captcha_data["max_solution_check"]:
         # We do not delete it from flask_app.captcha_cdn; let TTL cache GC handle it
         del flask_app.captchas_solution[solution_id]
 
@@ -198,13 +244,12 @@ def check_solution(solution_id: str):
             418,
         )
 
-    flask_app.captchas_solution[solution_id]["solution_checked"] += 1
+    captcha_data["solution_checked"] += 1
 
     data = {"case_sensitive_correct": False, "case_insensitive_correct": False}
 
     rq_data = request.get_json()
     attempt = rq_data.get("attempt")
-    captcha_data = flask_app.captchas_solution.get(solution_id)
 
     if not attempt:
         return {
@@ -213,10 +258,18 @@ def check_solution(solution_id: str):
             "text": "attempt not found in HTTP json",
         }, 400
 
-    if attempt == captcha_data["solution"]:  # type: ignore
+    # Constant-time comparisons so response timing can't leak the solution;
+    # compare bytes since compare_digest rejects non-ASCII strings.
+    # An exact match implies a case-insensitive one, so skip the lowering then
+    if hmac.compare_digest(
+        attempt.encode(), captcha_data["solution"].encode()  # type: ignore
+    ):
         data["case_sensitive_correct"] = True
+        data["case_insensitive_correct"] = True
 
-    if attempt.lower() == captcha_data["solution"].lower():  # type: ignore
+    elif hmac.compare_digest(
+        attempt.lower().encode(), captcha_data["solution_lower"].encode()  # type: ignore
+    ):
         data["case_insensitive_correct"] = True
 
     return jsonify(data)
@@ -1,8 +1,24 @@
 from typing import Any
 
+from app.utils import TTLCache
+
 
 def test_proper_insertion(client: Any, captcha_data: dict):
     """Check normal usage"""
     _ = client.get(captcha_data["cdn_url"])
 
     assert len(client.application.captcha_cdn)
+
+
+def test_maxsize_eviction():
+    """Check that the oldest record is evicted once maxsize is reached"""
+    cache: TTLCache[str, int] = TTLCache(ttl=30, maxsize=2)
+
+    cache["oldest"] = 1
+    cache["middle"] = 2
+    cache["newest"] = 3
+
+    assert "oldest" not in cache
+    assert "middle" in cache
+    assert "newest" in cache
+    assert len(cache) == 2
@@ -17,6 +17,19 @@ def test_max_usage(client: Any, captcha_data: dict):
     assert response.status_code == 418
 
 
+def test_etag_revalidation(client: Any, captcha_data: dict):
+    """Check that 304 revalidations do not burn the access quota"""
+    first = client.get(captcha_data["cdn_url"])
+
+    for _ in range(3):
+        response = client.get(
+            captcha_data["cdn_url"],
+            headers={"If-None-Match": first.headers["ETag"]},
+        )
+
+        assert response.status_code == 304
+
+
 def test_bad_url(client: Any, captcha_data: dict):
     """Check with a bad URL"""
     response = client.get(captcha_data["cdn_url"] + "ThisWillNotExist")